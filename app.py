@@ -1,17 +1,23 @@
 # app.py
 import os
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify
 from functools import lru_cache
-import hashlib
 import sqlite3
 import datetime
 import json
+import queue
+import threading
+import time
+import numpy as np
+import torch
+from concurrent.futures import ThreadPoolExecutor
 
 from models.claim_extractor import ClaimExtractor
 from models.keyword_extractor import KeywordExtractor
 from models.evidence_retriever import EvidenceRetriever
-from models.nli_classifier import NLIClassifier
-from utils.similarity import calculate_similarity
+from models.nli_classifier import NLIClassifier, LABEL_IDS, NEUTRAL_ID
+from utils.similarity import calculate_similarity_batch, get_similarity_calculator
+from utils.cache import TwoTierCache
 from utils.config import Config
 
 
@@ -22,79 +28,102 @@ evidence_retriever = EvidenceRetriever()
 nli_classifier = NLIClassifier()
 
 
+# Extraction is deterministic, so repeated texts (retries, duplicate clicks)
+# skip the spaCy pass. Tuples keep the cached values immutable.
+@lru_cache(maxsize=1024)
+def _extract_claims(text):
+    return tuple(claim_extractor.extract_claims(text))
+
+@lru_cache(maxsize=1024)
+def _extract_keywords(claim):
+    return tuple(keyword_extractor.extract_keywords(claim))
+
+
+class PipelineCancelled(Exception):
+    """Raised from a progress callback to abandon a verification between steps"""
+
+
 class TruthCheckSystem:
     def __init__(self):
         self.claim_extractor = claim_extractor
         self.keyword_extractor = keyword_extractor
         self.evidence_retriever = evidence_retriever
         self.nli_classifier = nli_classifier
-        self.cache = {}
-        
-    def _get_cache_key(self, text):
-        """Generate cache key for claim"""
-        return hashlib.md5(text.encode()).hexdigest()
+        self.cache = TwoTierCache()
     
-    def verify_claim(self, text):
+    def verify_claim(self, text, progress=None):
         """
         Enhanced fact verification with multi-evidence aggregation
         and consensus mechanism (similar to FactCheck system)
+        
+        progress, if given, is called with each step name as it completes;
+        it may raise PipelineCancelled to stop the remaining steps.
         """
+        report = progress or (lambda step: None)
+        
         try:
-            # Check cache
-            cache_key = self._get_cache_key(text)
-            if cache_key in self.cache:
+            # Check cache (exact repeats first, then promoted paraphrases)
+            cached = self.cache.get(text)
+            if cached is not None:
                 print("Returning cached result")
-                return self.cache[cache_key]
+                report('cache')
+                return cached
             
             # Step 1: Extract claims
-            claims = self.claim_extractor.extract_claims(text)
+            claims = _extract_claims(text)
+            report('extract')
             if not claims:
                 result = ("Low Confidence", 0.3, "No valid claims found. Please provide a clear factual statement.")
-                self.cache[cache_key] = result
+                self.cache.put(text, result)
                 return result
             
             claim = claims[0]
             
             # Step 2: Extract keywords
-            keywords = self.keyword_extractor.extract_keywords(claim)
+            keywords = _extract_keywords(claim)
+            report('keywords')
             
             # Step 3: Retrieve evidence from multiple sources
             evidence_items = self.evidence_retriever.get_evidence(keywords)
+            report('retrieve')
             
             if not evidence_items:
-                result = ("Low Confidence", 0.3, "Not enough reliable evidence found.")
-                self.cache[cache_key] = result
-                return result
+                # Usually a transient fetch failure: don't cache, retry next time
+                return ("Low Confidence", 0.3, "Not enough reliable evidence found.")
             
             # Step 4: Filter by semantic similarity
-            relevant_evidence = []
-            for item in evidence_items:
-                similarity = calculate_similarity(claim, item['content'])
-                if similarity > Config.SIMILARITY_THRESHOLD:
-                    item['similarity_score'] = similarity
-                    relevant_evidence.append(item)
-            
-            if not relevant_evidence:
-                result = ("Low Confidence", 0.4, "No semantically relevant evidence found.")
-                self.cache[cache_key] = result
-                return result
+            # Scores are kept as parallel arrays so ranking is a few vector ops
+            sims = calculate_similarity_batch(claim, [e['content'] for e in evidence_items])
+            creds = np.array([e.get('credibility_score', 0.5) for e in evidence_items])
+            relevant = np.flatnonzero(sims > Config.SIMILARITY_THRESHOLD)
+            report('similarity')
             
-            # Step 5: Sort by combined score (credibility + similarity)
-            for item in relevant_evidence:
-                item['combined_score'] = (
-                    item.get('credibility_score', 0.5) * 0.6 +
-                    item.get('similarity_score', 0.5) * 0.4
-                )
+            if relevant.size == 0:
+                # May come from a partial retrieval, so it is not cached either
+                return ("Low Confidence", 0.4, "No semantically relevant evidence found.")
             
-            relevant_evidence.sort(key=lambda x: x['combined_score'], reverse=True)
+            # Step 5: Sort by combined score (credibility + similarity)
+            combined = creds[relevant] * 0.6 + sims[relevant] * 0.4
+            order = np.argsort(-combined, kind='stable')
             
             # Step 6: Multi-Evidence NLI with Consensus Mechanism
-            # Use top 4 evidence sources (as per FactCheck research)
-            top_evidence = relevant_evidence[:4]
+            # Use top evidence sources (4 by default, as per FactCheck research)
+            top_evidence = []
+            for pos in order[:Config.TOP_EVIDENCE_FOR_NLI]:
+                item = evidence_items[relevant[pos]]
+                item['similarity_score'] = float(sims[relevant[pos]])
+                item['combined_score'] = float(combined[pos])
+                top_evidence.append(item)
+            
+            # Classify all pairs in one batched forward pass per model
+            nli_batch = self.nli_classifier.classify_batch(
+                claim, [e['content'] for e in top_evidence]
+            )
+            
+            report('nli')
             
             nli_results = []
-            for evidence_item in top_evidence:
-                nli_result = self.nli_classifier.classify(claim, evidence_item['content'])
+            for evidence_item, nli_result in zip(top_evidence, nli_batch):
                 nli_results.append({
                     'nli': nli_result,
                     'credibility': evidence_item.get('credibility_score', 0.5),
@@ -104,43 +133,35 @@ class TruthCheckSystem:
                 })
             
             # Step 7: Weighted Consensus Voting
-            entailment_score = 0
-            contradiction_score = 0
-            neutral_score = 0
-            
-            total_weight = 0
-            for result in nli_results:
-                # Weight by credibility and confidence
-                weight = result['credibility'] * result['nli']['confidence']
-                total_weight += weight
-                
-                if result['nli']['label'] == 'ENTAILMENT':
-                    entailment_score += weight
-                elif result['nli']['label'] == 'CONTRADICTION':
-                    contradiction_score += weight
-                else:
-                    neutral_score += weight
+            # Weight by credibility and confidence; one bincount reduces all votes
+            weights = np.array([r['credibility'] * r['nli']['confidence'] for r in nli_results])
+            labels = np.array(
+                # Vote index per NLI label (anything else counts as NEUTRAL)
+                [LABEL_IDS.get(r['nli']['label'], NEUTRAL_ID) for r in nli_results],
+                dtype=np.intp
+            )
+            scores = np.bincount(labels, weights=weights, minlength=len(LABEL_IDS))
             
             # Normalize scores
+            total_weight = scores.sum()
             if total_weight > 0:
-                entailment_score /= total_weight
-                contradiction_score /= total_weight
-                neutral_score /= total_weight
+                scores /= total_weight
             
             # Step 8: Determine final label with consensus threshold
             consensus_threshold = 0.6  # Require 60% agreement
             
-            max_score = max(entailment_score, contradiction_score, neutral_score)
+            # argmax prefers ENTAILMENT, then CONTRADICTION, on ties
+            winner = int(np.argmax(scores))
+            final_confidence = float(scores[winner])
             
-            if max_score == entailment_score and entailment_score >= consensus_threshold:
+            if winner == LABEL_IDS['ENTAILMENT'] and final_confidence >= consensus_threshold:
                 label = "True"
-                final_confidence = entailment_score
-            elif max_score == contradiction_score and contradiction_score >= consensus_threshold:
+            elif winner == LABEL_IDS['CONTRADICTION'] and final_confidence >= consensus_threshold:
                 label = "False"
-                final_confidence = contradiction_score
             else:
                 label = "Low Confidence"
-                final_confidence = max(entailment_score, contradiction_score, neutral_score)
+            
+            report('consensus')
             
             # Step 9: Prepare evidence summary
             evidence_summary = self._format_evidence_summary(nli_results, top_evidence)
@@ -148,10 +169,12 @@ class TruthCheckSystem:
             result = (label, final_confidence, evidence_summary)
             
             # Cache result
-            self.cache[cache_key] = result
+            self.cache.put(text, result)
             
             return result
             
+        except PipelineCancelled:
+            raise
         except Exception as e:
             print(f"Error during claim verification: {e}")
             import traceback
@@ -188,9 +211,70 @@ class TruthCheckSystem:
 # Initialize system
 truthcheck_system_instance = TruthCheckSystem()
 
+# Runs streamed verifications off the request thread
+_pipeline_executor = ThreadPoolExecutor(max_workers=Config.PIPELINE_WORKERS,
+                                        thread_name_prefix='pipeline')
+
+DB_PATH = 'history.db'
+
+_db_local = threading.local()
+_db_write_queue = queue.Queue()
+_db_writer_lock = threading.Lock()
+_db_writer_pid = None
+
+
+def get_db():
+    """Return this thread's persistent SQLite connection (WAL mode)"""
+    conn = getattr(_db_local, 'conn', None)
+    # Connections must not be shared across forked worker processes
+    if conn is None or _db_local.pid != os.getpid():
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.row_factory = sqlite3.Row
+        _db_local.conn = conn
+        _db_local.pid = os.getpid()
+    return conn
+
+def _db_writer():
+    """Drain queued history rows and commit them in batches every 100ms"""
+    while True:
+        rows = [_db_write_queue.get()]
+        while True:
+            try:
+                rows.append(_db_write_queue.get_nowait())
+            except queue.Empty:
+                break
+        
+        try:
+            conn = get_db()
+            conn.executemany('INSERT INTO verifications (claim, label, confidence) VALUES (?, ?, ?)',
+                             rows)
+            conn.commit()
+        except Exception as e:
+            print(f"DB Error: {e}")
+        
+        time.sleep(0.1)
+
+def save_verification(claim, label, confidence):
+    """Queue a verification for the background writer"""
+    global _db_writer_pid
+    
+    # Start the writer lazily so each (forked) process gets its own thread
+    if _db_writer_pid != os.getpid():
+        with _db_writer_lock:
+            if _db_writer_pid != os.getpid():
+                threading.Thread(target=_db_writer, daemon=True).start()
+                _db_writer_pid = os.getpid()
+    
+    _db_write_queue.put((claim, label, float(confidence)))
+
 def init_db():
     """Initialize SQLite database"""
-    conn = sqlite3.connect('history.db')
+    # Runs at import, possibly in a gunicorn master that forks afterwards, so
+    # use a short-lived connection rather than get_db()'s persistent one
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute('PRAGMA journal_mode=WAL')
     c = conn.cursor()
     c.execute('''
         CREATE TABLE IF NOT EXISTS verifications (
@@ -207,11 +291,38 @@ def init_db():
 init_db()
 
 
+def _warmup():
+    """Run one dummy inference through each model to pay lazy-init costs up front"""
+    try:
+        nli_classifier.classify("x", "y")
+        calculate_similarity_batch("x", ["y"])
+        claim_extractor.extract_claims("This is a warmup sentence for the extractor.")
+        keyword_extractor.extract_keywords("This is a warmup sentence for the extractor.")
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        print("✓ Models warmed up")
+    except Exception as e:
+        print(f"Warmup error: {e}")
+
+
+def start_warmup():
+    """Warm models in the background so the first request avoids the cold start"""
+    threading.Thread(target=_warmup, daemon=True).start()
+
+
 def create_app():
     app = Flask(__name__, static_folder='static', template_folder='templates')
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', Config.SECRET_KEY)
     app.config['DEBUG'] = Config.DEBUG
     
+    if Config.PRELOAD_MODELS:
+        # Preloaded by gunicorn: load the (otherwise lazy) SBERT weights so the
+        # workers share them, but run no forward pass before fork -- OpenMP
+        # thread pools don't survive it. Workers warm up in post_fork.
+        get_similarity_calculator()
+    else:
+        start_warmup()
+    
     @app.route('/')
     def index():
         return render_template('index.html')
@@ -231,12 +342,9 @@ def create_app():
     @app.route('/api/history')
     def get_history():
         try:
-            conn = sqlite3.connect('history.db')
-            conn.row_factory = sqlite3.Row
-            c = conn.cursor()
+            c = get_db().cursor()
             c.execute('SELECT * FROM verifications ORDER BY date DESC LIMIT 50')
             rows = c.fetchall()
-            conn.close()
             
             history = []
             for row in rows:
@@ -262,16 +370,8 @@ def create_app():
             
             label, confidence, evidence = truthcheck_system_instance.verify_claim(claim_text)
             
-            # Save to DB
-            try:
-                conn = sqlite3.connect('history.db')
-                c = conn.cursor()
-                c.execute('INSERT INTO verifications (claim, label, confidence) VALUES (?, ?, ?)',
-                          (claim_text, label, float(confidence)))
-                conn.commit()
-                conn.close()
-            except Exception as e:
-                print(f"DB Error: {e}")
+            # Save to DB (committed off the request path by the writer thread)
+            save_verification(claim_text, label, confidence)
             
             result = {
                 'label': label,
@@ -286,6 +386,63 @@ def create_app():
             print(f"API error: {e}")
             return jsonify({'error': f'Server error: {str(e)}'}), 500
     
+    @app.route('/api/verify/stream', methods=['POST'])
+    def verify_claim_stream():
+        """Stream pipeline progress and the final verdict as Server-Sent Events"""
+        data = request.get_json(silent=True) or {}
+        claim_text = data.get('claim', '')
+        
+        if not claim_text:
+            return jsonify({'error': 'No claim provided'}), 400
+        
+        events = queue.Queue()
+        cancelled = threading.Event()
+        
+        def progress(step):
+            # The client went away: skip the remaining (expensive) steps
+            if cancelled.is_set():
+                raise PipelineCancelled()
+            events.put({'step': step, 'done': True})
+        
+        def run_pipeline():
+            try:
+                label, confidence, evidence = truthcheck_system_instance.verify_claim(
+                    claim_text, progress=progress
+                )
+                if cancelled.is_set():
+                    return
+                save_verification(claim_text, label, confidence)
+                events.put({
+                    'step': 'result',
+                    'label': label,
+                    'confidence': round(confidence, 3),
+                    'evidence': evidence,
+                    'claim': claim_text
+                })
+            except PipelineCancelled:
+                print("Streamed verification cancelled: client disconnected")
+            except Exception as e:
+                print(f"API error: {e}")
+                events.put({'step': 'error', 'error': f'Server error: {str(e)}'})
+            finally:
+                events.put(None)
+        
+        _pipeline_executor.submit(run_pipeline)
+        
+        def stream():
+            try:
+                while True:
+                    event = events.get()
+                    if event is None:
+                        break
+                    yield f"data: {json.dumps(event)}\n\n"
+            finally:
+                # Runs when the server closes the response, including on disconnect
+                cancelled.set()
+        
+        return Response(stream(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    
     @app.route('/health')
     def health_check():
         return jsonify({'status': 'healthy', 'message': 'TruthCheck is running.'})
@@ -0,0 +1,40 @@
+# gunicorn.conf.py
+# Production entrypoint: gunicorn -c gunicorn.conf.py run:app
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 7860)}"
+worker_class = "gthread"
+
+# The layout is chosen from the environment rather than by probing CUDA here:
+# this file runs in the master, and any CUDA query before fork makes CUDA
+# unusable in every worker forked afterwards
+USE_GPU = os.environ.get('USE_GPU', 'False').lower() == 'true'
+
+if USE_GPU:
+    # One CUDA context per process: load in a single worker with more threads
+    preload_app = False
+    workers = 1
+    threads = 8
+    # The worker downloads, loads and torch.compile-warms the NLI models
+    # before its first heartbeat
+    timeout = int(os.environ.get('GUNICORN_TIMEOUT', 1800))
+else:
+    # Load the model weights once in the master; forked workers share them
+    # copy-on-write instead of each loading their own
+    preload_app = True
+    workers = int(os.environ.get('WEB_CONCURRENCY', max(2, (os.cpu_count() or 2) // 2)))
+    threads = 4
+    timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+    
+    # Read by Config before the app is imported: hide GPUs so nothing touches
+    # CUDA before fork, and load weights without running any forward pass
+    os.environ['CUDA_VISIBLE_DEVICES'] = ''
+    os.environ['PRELOAD_MODELS'] = 'True'
+    
+    def post_fork(server, worker):
+        # Forward passes (and their OpenMP thread pools) start in each worker
+        from app import start_warmup
+        start_warmup()
+
+# One streamed-verification slot per server thread
+os.environ.setdefault('PIPELINE_WORKERS', str(threads))
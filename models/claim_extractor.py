@@ -2,10 +2,19 @@
 import re
 import spacy
 
+# Sentences starting with these are questions or commands, not claims
+QUESTION_WORDS = ('How', 'What', 'When', 'Where', 'Why', 'Who')
+COMMAND_RE = re.compile(r'^(Please|Let|Can you)', re.IGNORECASE)
+
+
 class ClaimExtractor:
     def __init__(self): # Corrected __init__
         try:
-            self.nlp = spacy.load("en_core_web_sm")
+            # Only the parser is needed (for sentence boundaries)
+            self.nlp = spacy.load(
+                "en_core_web_sm",
+                disable=["ner", "tagger", "lemmatizer", "attribute_ruler"]
+            )
         except OSError:
             print("Please install spaCy English model: python -m spacy download en_core_web_sm")
             raise
@@ -25,8 +34,8 @@ class ClaimExtractor:
             # Filter out questions, commands, and short sentences
             if (len(sentence.split()) > 5 and 
                 not sentence.endswith('?') and 
-                not sentence.startswith(('How', 'What', 'When', 'Where', 'Why', 'Who')) and
-                not re.match(r'^(Please|Let|Can you)', sentence, re.IGNORECASE)):
+                not sentence.startswith(QUESTION_WORDS) and
+                not COMMAND_RE.match(sentence)):
                 
                 claims.append(sentence)
         
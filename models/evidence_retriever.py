@@ -1,114 +1,227 @@
 # models/evidence_retriever.py
-import wikipedia
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import lxml.html
+from lxml import etree
+import re
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError
 from urllib.parse import quote_plus
 
+from utils.cache import ttl_cache
+from utils.config import Config
+
+
+WIKIPEDIA_API_URL = 'https://en.wikipedia.org/w/api.php'
+
+WIKIPEDIA_HEADERS = {
+    'User-Agent': 'TruthCheck/1.0 (https://github.com/CHRISDANIEL145/truth-check)'
+}
+
+# Module-level session so keep-alive connections (and TLS handshakes) are reused
+_SESSION = requests.Session()
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=20,
+    pool_maxsize=20,
+    max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=[500, 502, 503, 504])
+))
+_SESSION.headers['User-Agent'] = (
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+    '(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+)
+
+
+def _has_class(name):
+    """XPath predicate matching elements whose class list contains name"""
+    return f'contains(concat(" ", normalize-space(@class), " "), " {name} ")'
+
+# Pre-compiled selectors for the search result pages
+DDG_ROWS = etree.XPath('//tr')
+DDG_LINK = etree.XPath(f'.//a[{_has_class("result-link")}]')
+DDG_SNIPPET = etree.XPath(f'.//td[{_has_class("result-snippet")}]')
+GOOGLE_RESULTS = etree.XPath(f'//div[{_has_class("g")}]')
+GOOGLE_LINK = etree.XPath('.//a')
+GOOGLE_TITLE = etree.XPath('.//h3')
+GOOGLE_SNIPPET = etree.XPath(f'.//div[{_has_class("VwiC3b")} or {_has_class("lEBKkf")}]')
+
+
+# Domain credibility rules in priority order. Each rule is a lookahead anchored
+# at the start of the URL, so the first matching alternative wins.
+DOMAIN_RULES = (
+    ('wikipedia', r'.*wikipedia\.org', 0.95),
+    ('gov', r'.*\.gov/?\Z', 0.92),
+    ('edu', r'.*\.edu/?\Z', 0.88),
+    ('news', r'.*(?:reuters\.com|apnews\.com|bbc\.com)', 0.85),
+    ('science', r'.*(?:nature\.com|science\.org|ncbi\.nlm\.nih\.gov)', 0.90),
+)
+DOMAIN_RE = re.compile(
+    '|'.join(f'(?P<{name}>(?={pattern}))' for name, pattern, _ in DOMAIN_RULES),
+    re.DOTALL
+)
+DOMAIN_SCORES = {name: score for name, _, score in DOMAIN_RULES}
+
+# Fallback scores when no domain rule matches
+SOURCE_TYPE_SCORES = {
+    'wikipedia': 0.95,
+    'academic': 0.88,
+    'government': 0.92,
+    'news_trusted': 0.80
+}
+
+
+def _keyword_set_key(retriever, keywords):
+    """Order- and case-insensitive cache key for a keyword list"""
+    return retriever, tuple(sorted(k.lower() for k in keywords))
+
+
+class _PartialEvidence(Exception):
+    """Raised inside the memoized fetch so merges missing a source are not cached"""
+    
+    def __init__(self, evidence):
+        super().__init__("evidence source failed or timed out")
+        self.evidence = evidence
+
+
+@ttl_cache(maxsize=512, ttl=Config.EVIDENCE_CACHE_TTL, key=_keyword_set_key,
+           empty_ttl=Config.EMPTY_RESULT_TTL)
+def _cached_fetch(retriever, keywords):
+    """Memoize retrieval per keyword set (searches still use the ranked order)"""
+    evidence, complete = retriever._fetch_evidence(list(keywords))
+    if not complete:
+        raise _PartialEvidence(tuple(evidence))
+    return tuple(evidence)
+
 
 class EvidenceRetriever:
     def __init__(self):
         self.wikipedia_timeout = 10
+        self.fetch_timeout = 10
         self.max_evidence_sources = 10
         self.trusted_domains = [
             'reuters.com', 'apnews.com', 'bbc.com', 'nature.com',
             'science.org', 'who.int', 'cdc.gov', 'nasa.gov', 
             'wikipedia.org', '.gov', '.edu'
         ]
+        # Shared pool: 3 concurrent fetches per claim, sized for a few claims at once
+        self._executor = ThreadPoolExecutor(max_workers=12, thread_name_prefix='evidence')
         
     def get_evidence(self, keywords):
         """Retrieve evidence from multiple sources with credibility scoring"""
-        evidence = []
+        # Claims sharing the same top keywords reuse one retrieval
+        try:
+            evidence = _cached_fetch(self, tuple(keywords[:5]))
+        except _PartialEvidence as partial:
+            evidence = partial.evidence
+        
+        # Callers annotate evidence dicts, so hand out copies
+        return [dict(item) for item in evidence]
+    
+    def _fetch_evidence(self, keywords):
+        """Fetch evidence from all sources (uncached).
+        
+        Returns (evidence, complete); complete is False if any source raised
+        or timed out. A source that answered with no results still counts.
+        """
+        query = ' '.join(keywords[:5])
         
-        # Get evidence from Wikipedia (most reliable)
-        wiki_evidence = self._get_wikipedia_evidence(keywords)
-        evidence.extend(wiki_evidence)
+        # Wikipedia, DuckDuckGo and Google are I/O-bound, so fetch them in parallel
+        wiki_future = self._executor.submit(self._get_wikipedia_evidence, ' '.join(keywords[:4]))
+        web_futures = [
+            self._executor.submit(self._search_duckduckgo_lite, query),
+            self._executor.submit(self._search_google_scrape, query),
+        ]
+        
+        results = {}
+        try:
+            for future in as_completed([wiki_future] + web_futures, timeout=self.fetch_timeout):
+                try:
+                    results[future] = future.result()
+                except Exception as e:
+                    print(f"Evidence fetch error: {e}")
+        except TimeoutError:
+            print("Evidence fetch timed out; using sources that responded")
         
-        # Get evidence from web search (using Google Custom Search as fallback)
-        web_evidence = self._get_web_search_evidence(keywords)
-        evidence.extend(web_evidence)
+        # Merge in submission order so ties keep a stable ordering
+        evidence = list(results.get(wiki_future, []))
+        web_evidence = []
+        for future in web_futures:
+            web_evidence.extend(results.get(future, []))
+        evidence.extend(web_evidence[:5])
         
         # Sort by credibility score and return top sources
         evidence.sort(key=lambda x: x.get('credibility_score', 0.0), reverse=True)
         
-        return evidence[:10]
+        complete = len(results) == 1 + len(web_futures)
+        return evidence[:10], complete
     
     def _assign_credibility_score(self, source_type, url):
         """Assign credibility scores based on source type and domain"""
-        if 'wikipedia.org' in url:
-            return 0.95
-        elif any(url.endswith(gov) for gov in ['.gov', '.gov/']):
-            return 0.92
-        elif any(url.endswith(edu) for edu in ['.edu', '.edu/']):
-            return 0.88
-        elif any(trusted in url for trusted in ['reuters.com', 'apnews.com', 'bbc.com']):
-            return 0.85
-        elif any(sci in url for sci in ['nature.com', 'science.org', 'ncbi.nlm.nih.gov']):
-            return 0.90
-        elif source_type == 'wikipedia':
-            return 0.95
-        elif source_type == 'academic':
-            return 0.88
-        elif source_type == 'government':
-            return 0.92
-        elif source_type == 'news_trusted':
-            return 0.80
-        else:
-            return 0.60
+        # One C-level regex scan picks the highest-priority domain rule
+        match = DOMAIN_RE.match(url)
+        if match:
+            return DOMAIN_SCORES[match.lastgroup]
+        return SOURCE_TYPE_SCORES.get(source_type, 0.60)
     
-    def _get_wikipedia_evidence(self, keywords):
+    @ttl_cache(maxsize=512, ttl=Config.SEARCH_CACHE_TTL, empty_ttl=Config.EMPTY_RESULT_TTL)
+    def _get_wikipedia_evidence(self, search_terms):
         """Retrieve evidence from Wikipedia"""
         evidence = []
         
         try:
-            search_terms = ' '.join(keywords[:4])
-            search_results = wikipedia.search(search_terms, results=5)
+            # Search and fetch intro extracts in a single MediaWiki API round-trip
+            # (generator=search feeds the top hits straight into prop=extracts)
+            params = {
+                'action': 'query',
+                'format': 'json',
+                'generator': 'search',
+                'gsrsearch': search_terms,
+                'gsrlimit': 5,
+                'prop': 'extracts|pageprops',
+                'ppprop': 'disambiguation',
+                'exintro': 1,
+                'explaintext': 1,
+                'exsentences': 7,
+                'exlimit': 'max'
+            }
+            response = _SESSION.get(WIKIPEDIA_API_URL, params=params, headers=WIKIPEDIA_HEADERS,
+                                    timeout=self.wikipedia_timeout)
+            response.raise_for_status()
+            pages = response.json().get('query', {}).get('pages', {})
             
-            for title in search_results:
-                try:
-                    summary = wikipedia.summary(title, sentences=7, auto_suggest=False)
-                    url = f'https://en.wikipedia.org/wiki/{title.replace(" ", "_")}'
-                    
-                    evidence.append({
-                        'content': summary,
-                        'source': f'Wikipedia - {title}',
-                        'url': url,
-                        'credibility_score': self._assign_credibility_score('wikipedia', url),
-                        'source_type': 'wikipedia'
-                    })
-                    
-                    if len(evidence) >= 3:
-                        break
-                        
-                except (wikipedia.DisambiguationError, wikipedia.PageError):
+            # Keep the search ranking order
+            pages = sorted(pages.values(), key=lambda page: page.get('index', 0))
+            
+            for page in pages:
+                # Skip missing and disambiguation pages
+                if 'missing' in page or 'disambiguation' in page.get('pageprops', {}):
+                    continue
+                
+                title = page.get('title', '')
+                summary = page.get('extract')
+                if not summary:
                     continue
+                
+                url = f'https://en.wikipedia.org/wiki/{title.replace(" ", "_")}'
+                
+                evidence.append({
+                    'content': summary,
+                    'source': f'Wikipedia - {title}',
+                    'url': url,
+                    'credibility_score': self._assign_credibility_score('wikipedia', url),
+                    'source_type': 'wikipedia'
+                })
+                
+                if len(evidence) >= 3:
+                    break
                     
         except Exception as e:
             print(f"Wikipedia search error: {e}")
+            raise
         
         return evidence
     
-    def _get_web_search_evidence(self, keywords):
-        """Retrieve evidence from web search using SearXNG metasearch"""
-        evidence = []
-        
-        try:
-            query = ' '.join(keywords[:5])
-            
-            # Method 1: Try DuckDuckGo Lite (more reliable)
-            ddg_results = self._search_duckduckgo_lite(query)
-            evidence.extend(ddg_results)
-            
-            # Method 2: If DuckDuckGo fails, use direct scraping with Google
-            if len(evidence) < 3:
-                google_results = self._search_google_scrape(query)
-                evidence.extend(google_results)
-            
-        except Exception as e:
-            print(f"Web search error: {e}")
-        
-        return evidence[:5]
-    
+    @ttl_cache(maxsize=512, ttl=Config.SEARCH_CACHE_TTL, empty_ttl=Config.EMPTY_RESULT_TTL)
     def _search_duckduckgo_lite(self, query):
         """Search using DuckDuckGo Lite (HTML version, more stable)"""
         results = []
@@ -116,91 +229,93 @@ class EvidenceRetriever:
         try:
             url = "https://lite.duckduckgo.com/lite/"
             data = {"q": query}
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
             
-            response = requests.post(url, data=data, headers=headers, timeout=10)
+            response = _SESSION.post(url, data=data, timeout=10)
             
-            if response.status_code == 200:
-                soup = BeautifulSoup(response.text, 'html.parser')
-                
-                # Find all result rows
-                result_table = soup.find_all('tr')
-                
-                for row in result_table[:10]:
-                    try:
-                        link = row.find('a', class_='result-link')
-                        snippet_td = row.find('td', class_='result-snippet')
+            if response.status_code != 200:
+                raise requests.HTTPError(f"DuckDuckGo Lite returned HTTP {response.status_code}")
+            
+            # Parse the raw bytes with lxml's C parser (no extra decode pass)
+            tree = lxml.html.fromstring(response.content)
+            
+            # Find all result rows
+            result_table = DDG_ROWS(tree)
+            
+            for row in result_table[:10]:
+                try:
+                    links = DDG_LINK(row)
+                    snippet_tds = DDG_SNIPPET(row)
+                    
+                    if links and snippet_tds:
+                        result_url = links[0].get('href', '')
+                        title = links[0].text_content().strip()
+                        snippet = snippet_tds[0].text_content().strip()
                         
-                        if link and snippet_td:
-                            result_url = link.get('href', '')
-                            title = link.get_text(strip=True)
-                            snippet = snippet_td.get_text(strip=True)
+                        if result_url and snippet:
+                            results.append({
+                                'content': snippet,
+                                'source': f'Web - {title}',
+                                'url': result_url,
+                                'credibility_score': self._assign_credibility_score('web', result_url),
+                                'source_type': 'web'
+                            })
                             
-                            if result_url and snippet:
-                                results.append({
-                                    'content': snippet,
-                                    'source': f'Web - {title}',
-                                    'url': result_url,
-                                    'credibility_score': self._assign_credibility_score('web', result_url),
-                                    'source_type': 'web'
-                                })
-                                
-                                if len(results) >= 3:
-                                    break
-                    except:
-                        continue
-                        
+                            if len(results) >= 3:
+                                break
+                except:
+                    continue
+                    
         except Exception as e:
             print(f"DuckDuckGo Lite error: {e}")
+            raise
         
         return results
     
+    @ttl_cache(maxsize=512, ttl=Config.SEARCH_CACHE_TTL, empty_ttl=Config.EMPTY_RESULT_TTL)
     def _search_google_scrape(self, query):
-        """Search using Google scraping (fallback method)"""
+        """Search using Google scraping"""
         results = []
         
         try:
             url = f"https://www.google.com/search?q={quote_plus(query)}"
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-            }
             
-            response = requests.get(url, headers=headers, timeout=10)
+            response = _SESSION.get(url, timeout=10)
             
-            if response.status_code == 200:
-                soup = BeautifulSoup(response.text, 'html.parser')
-                
-                # Find search results
-                search_results = soup.find_all('div', class_='g')
-                
-                for result in search_results[:5]:
-                    try:
-                        link = result.find('a')
-                        snippet_div = result.find('div', class_=['VwiC3b', 'lEBKkf'])
+            if response.status_code != 200:
+                raise requests.HTTPError(f"Google returned HTTP {response.status_code}")
+            
+            tree = lxml.html.fromstring(response.content)
+            
+            # Find search results
+            search_results = GOOGLE_RESULTS(tree)
+            
+            for result in search_results[:5]:
+                try:
+                    links = GOOGLE_LINK(result)
+                    snippet_divs = GOOGLE_SNIPPET(result)
+                    
+                    if links and snippet_divs:
+                        result_url = links[0].get('href', '')
+                        titles = GOOGLE_TITLE(result)
+                        title_text = titles[0].text_content().strip() if titles else 'Unknown'
+                        snippet = snippet_divs[0].text_content().strip()
                         
-                        if link and snippet_div:
-                            result_url = link.get('href', '')
-                            title = result.find('h3')
-                            title_text = title.get_text(strip=True) if title else 'Unknown'
-                            snippet = snippet_div.get_text(strip=True)
+                        if result_url.startswith('http') and snippet:
+                            results.append({
+                                'content': snippet,
+                                'source': f'Web - {title_text}',
+                                'url': result_url,
+                                'credibility_score': self._assign_credibility_score('web', result_url),
+                                'source_type': 'web'
+                            })
                             
-                            if result_url.startswith('http') and snippet:
-                                results.append({
-                                    'content': snippet,
-                                    'source': f'Web - {title_text}',
-                                    'url': result_url,
-                                    'credibility_score': self._assign_credibility_score('web', result_url),
-                                    'source_type': 'web'
-                                })
-                                
-                                if len(results) >= 3:
-                                    break
-                    except:
-                        continue
-                        
+                            if len(results) >= 3:
+                                break
+                except:
+                    continue
+                    
         except Exception as e:
             print(f"Google scrape error: {e}")
+            raise
         
         return results
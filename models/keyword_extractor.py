@@ -1,40 +1,79 @@
 # models/keyword_extractor.py
+import heapq
 import spacy
 from collections import Counter
+from operator import itemgetter
 
 class KeywordExtractor:
+    _instance = None
+    _initialized = False
+    
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+    
     def __init__(self): # Corrected __init__
+        if self._initialized:
+            return
+        
         try:
-            self.nlp = spacy.load("en_core_web_sm")
+            # Lemmas are unused; attribute_ruler stays since it sets token.pos_
+            self.nlp = spacy.load("en_core_web_sm", disable=["lemmatizer"])
+            self._initialized = True
         except OSError:
             print("Please install spaCy English model: python -m spacy download en_core_web_sm")
             raise
     
     def extract_keywords(self, text):
         """Extract keywords and named entities from text"""
-        doc = self.nlp(text)
-        
-        keywords = []
-        
-        # Extract named entities
-        for ent in doc.ents:
-            if ent.label_ in ['PERSON', 'ORG', 'GPE', 'PRODUCT', 'EVENT', 'DATE']:
-                keywords.append(ent.text)
+        return self._keywords_from_doc(self.nlp(text))
+    
+    def extract_keywords_batch(self, texts):
+        """Extract keywords for many texts, streaming them through nlp.pipe"""
+        return [
+            self._keywords_from_doc(doc)
+            for doc in self.nlp.pipe(texts, batch_size=32, n_process=1)
+        ]
+    
+    def _keywords_from_doc(self, doc):
+        """Collect entities, noun phrases and nouns from a processed doc"""
+        # Separate buckets keep the original entity -> phrase -> word order,
+        # which decides ties in the top-10 selection below
+        entities, phrases, words = [], [], []
         
-        # Extract noun phrases and important words
+        # Extract noun phrases (the parser's syntax iterator)
         for chunk in doc.noun_chunks:
             if len(chunk.text.split()) <= 3:  # Avoid very long phrases
-                keywords.append(chunk.text)
+                phrases.append(chunk.text)
         
-        # Extract individual important words
+        # One pass over the tokens: named entities are rebuilt from the IOB
+        # tags as the span closes, and important words are picked up alongside
+        ent_start = None
         for token in doc:
+            if ent_start is not None and token.ent_iob_ != 'I':
+                self._add_entity(doc[ent_start:token.i], entities)
+                ent_start = None
+            if token.ent_iob_ == 'B':
+                ent_start = token.i
+            
             if (token.pos_ in ['NOUN', 'PROPN'] and 
                 not token.is_stop and 
                 not token.is_punct and 
                 len(token.text) > 2):
-                keywords.append(token.text)
+                words.append(token.text)
+        
+        if ent_start is not None:
+            self._add_entity(doc[ent_start:len(doc)], entities)
+        
+        keywords = entities + phrases + words
         
-        # Remove duplicates and return most common
+        # Remove duplicates and return the 10 most common (O(n log k) heap select)
         keyword_counts = Counter(keywords)
-        return [word for word, count in keyword_counts.most_common(10)]
-
+        return [word for word, _ in heapq.nlargest(10, keyword_counts.items(), key=itemgetter(1))]
+    
+    @staticmethod
+    def _add_entity(span, entities):
+        """Keep a named entity if its type is useful for search"""
+        if span[0].ent_type_ in ['PERSON', 'ORG', 'GPE', 'PRODUCT', 'EVENT', 'DATE']:
+            entities.append(span.text)
@@ -1,7 +1,112 @@
 # models/nli_classifier.py
-from transformers import pipeline
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from transformers import AutoTokenizer, pipeline
+import numpy as np
 import torch
 from collections import Counter
+from functools import cached_property
+from types import MappingProxyType
+
+from utils.config import Config
+
+
+# Canonical labels; predictions are carried as indices into this tuple
+LABELS = ('ENTAILMENT', 'CONTRADICTION', 'NEUTRAL')
+LABEL_IDS = MappingProxyType({label: i for i, label in enumerate(LABELS)})
+NEUTRAL_ID = LABEL_IDS['NEUTRAL']
+
+# Raw model labels -> canonical label (read-only, shared by every call)
+LABEL_MAPPING = MappingProxyType({
+    'ENTAILMENT': 'ENTAILMENT',
+    'CONTRADICTION': 'CONTRADICTION',
+    'NEUTRAL': 'NEUTRAL',
+    'entailment': 'ENTAILMENT',
+    'contradiction': 'CONTRADICTION',
+    'neutral': 'NEUTRAL',
+    'LABEL_0': 'CONTRADICTION',
+    'LABEL_1': 'NEUTRAL',
+    'LABEL_2': 'ENTAILMENT'
+})
+
+
+def aggregate_votes(scores, labels, weights):
+    """Weighted ensemble vote over K evidences x M models.
+    
+    scores/labels are (K, M) confidences and canonical label ids, weights is (M,).
+    Returns (final label ids, confidences, (K, 3) weighted scores).
+    """
+    one_hot = labels[:, :, None] == np.arange(len(LABELS))
+    weighted = (one_hot * (scores * weights)[:, :, None]).sum(axis=1)
+    
+    # argmax keeps LABELS order on ties
+    final_ids = weighted.argmax(axis=1)
+    totals = weighted.sum(axis=1)
+    best = weighted[np.arange(len(weighted)), final_ids]
+    confidences = np.divide(best, totals, out=np.full_like(best, 0.5), where=totals > 0)
+    return final_ids, confidences, weighted
+
+
+class NLIBatcher:
+    """Micro-batches (claim, evidence) pairs from concurrent requests into shared forward passes"""
+    
+    def __init__(self, classify_pairs, max_batch=Config.NLI_MAX_BATCH,
+                 max_wait=Config.NLI_BATCH_WAIT):
+        self._classify_pairs = classify_pairs
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._jobs = None
+        self._worker_pid = None
+        self._lock = threading.Lock()
+    
+    def submit(self, claims, evidences):
+        """Queue the pairs and block until all their results are ready"""
+        jobs = self._ensure_worker()
+        futures = []
+        for claim, evidence in zip(claims, evidences):
+            future = Future()
+            jobs.put((claim, evidence, future))
+            futures.append(future)
+        return [future.result() for future in futures]
+    
+    def _ensure_worker(self):
+        """Start the worker thread once per process (threads don't survive a fork)"""
+        pid = os.getpid()
+        if self._worker_pid != pid:
+            with self._lock:
+                if self._worker_pid != pid:
+                    self._jobs = queue.Queue()
+                    threading.Thread(target=self._run, args=(self._jobs,), daemon=True).start()
+                    self._worker_pid = pid
+        return self._jobs
+    
+    def _run(self, jobs):
+        """Drain up to max_batch queued pairs (waiting at most max_wait) and classify them together"""
+        while True:
+            batch = [jobs.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(jobs.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            
+            claims, evidences, futures = zip(*batch)
+            try:
+                results = self._classify_pairs(list(claims), list(evidences))
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            
+            for future, result in zip(futures, results):
+                future.set_result(result)
 
 
 class NLIClassifier:
@@ -25,13 +130,11 @@ class NLIClassifier:
             
             # Model 1: RoBERTa-large-MNLI (most accurate)
             try:
+                nli_pipeline, backend = self._load_pipeline("roberta-large-mnli", device)
                 self.models.append({
                     'name': 'roberta-large-mnli',
-                    'pipeline': pipeline(
-                        "text-classification",
-                        model="roberta-large-mnli",
-                        device=device
-                    ),
+                    'pipeline': nli_pipeline,
+                    'backend': backend,
                     'weight': 0.5
                 })
                 print("✓ Loaded RoBERTa-large-MNLI")
@@ -40,13 +143,13 @@ class NLIClassifier:
             
             # Model 2: DeBERTa-v3-large MNLI fine-tuned (use pre-trained version)
             try:
+                nli_pipeline, backend = self._load_pipeline(
+                    "MoritzLaurer/DeBERTa-v3-large-mnli-fever-anli-ling-wanli", device
+                )
                 self.models.append({
                     'name': 'deberta-v3-large-mnli',
-                    'pipeline': pipeline(
-                        "text-classification",
-                        model="MoritzLaurer/DeBERTa-v3-large-mnli-fever-anli-ling-wanli",
-                        device=device
-                    ),
+                    'pipeline': nli_pipeline,
+                    'backend': backend,
                     'weight': 0.5
                 })
                 print("✓ Loaded DeBERTa-v3-large-MNLI")
@@ -54,27 +157,42 @@ class NLIClassifier:
                 print(f"⚠ Failed to load DeBERTa-v3-large-MNLI: {e}")
             
             if not self.models:
-                # Fallback to BART if both fail
-                try:
-                    self.models.append({
-                        'name': 'bart-large-mnli',
-                        'pipeline': pipeline(
-                            "zero-shot-classification",
-                            model="facebook/bart-large-mnli",
-                            device=device
-                        ),
-                        'weight': 1.0
-                    })
-                    print("✓ Loaded BART-large-MNLI (fallback)")
-                except Exception as e:
-                    print(f"✗ Failed to load any NLI model: {e}")
-                    raise Exception("No NLI models loaded successfully")
+                # Fallback to BART only if both fail
+                self.models.append(self._fallback_model)
+            
+            # Map each model's raw label ids to canonical label ids once
+            for model_info in self.models:
+                if 'bart' not in model_info['name']:
+                    model_info['label_lut'] = self._build_label_lut(
+                        model_info['pipeline'].model.config
+                    )
+            
+            # Quantize Linear layers to int8 for faster CPU inference
+            # (ONNX Runtime models are optimized by their own session)
+            torch_models = [m for m in self.models if m['backend'] == 'torch']
+            if device == -1 and Config.QUANTIZE_CPU_MODELS:
+                for model_info in torch_models:
+                    # Optional: a failure keeps the (working) float32 model
+                    pipeline_obj = model_info['pipeline']
+                    try:
+                        pipeline_obj.model = torch.quantization.quantize_dynamic(
+                            pipeline_obj.model, {torch.nn.Linear}, dtype=torch.qint8
+                        )
+                    except Exception as e:
+                        print(f"⚠ int8 quantization failed for {model_info['name']}, keeping float32: {e}")
+                print("✓ Quantized NLI models to int8 (CPU)")
+            elif device == 0:
+                for model_info in torch_models:
+                    self._optimize_for_gpu(model_info)
+                print("✓ Optimized NLI models for GPU")
             
             # Normalize weights
             total_weight = sum(m['weight'] for m in self.models)
             for model in self.models:
                 model['weight'] /= total_weight
             
+            self._batcher = NLIBatcher(self._classify_pairs) if Config.NLI_MICRO_BATCHING else None
+            
             self._initialized = True
             print(f"✓ Successfully loaded {len(self.models)} NLI model(s)")
             
@@ -83,100 +201,204 @@ class NLIClassifier:
             self.models = []
             self._initialized = False
     
+    @cached_property
+    def _fallback_model(self):
+        """Zero-shot BART-large-MNLI, loaded lazily and only when needed"""
+        try:
+            model_info = {
+                'name': 'bart-large-mnli',
+                'pipeline': pipeline(
+                    "zero-shot-classification",
+                    model="facebook/bart-large-mnli",
+                    device=0 if torch.cuda.is_available() else -1
+                ),
+                'backend': 'torch',
+                'weight': 1.0
+            }
+            print("✓ Loaded BART-large-MNLI (fallback)")
+            return model_info
+        except Exception as e:
+            print(f"✗ Failed to load any NLI model: {e}")
+            raise Exception("No NLI models loaded successfully")
+    
+    def _load_pipeline(self, model_id, device):
+        """Load a text-classification pipeline on the configured backend"""
+        if Config.NLI_BACKEND == 'onnx':
+            try:
+                return self._load_onnx_pipeline(model_id), 'onnx'
+            except Exception as e:
+                print(f"⚠ ONNX Runtime unavailable for {model_id}, using PyTorch: {e}")
+        
+        return pipeline("text-classification", model=model_id, device=device), 'torch'
+    
+    def _load_onnx_pipeline(self, model_id):
+        """Load an ONNX Runtime pipeline, exporting the model once to the on-disk cache"""
+        import onnxruntime
+        from optimum.onnxruntime import ORTModelForSequenceClassification
+        
+        provider = 'CUDAExecutionProvider' if torch.cuda.is_available() else 'CPUExecutionProvider'
+        session_options = onnxruntime.SessionOptions()
+        session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        
+        export_dir = os.path.join(Config.ONNX_CACHE_DIR, model_id.replace('/', '--'))
+        if os.path.isdir(export_dir):
+            model = ORTModelForSequenceClassification.from_pretrained(
+                export_dir, provider=provider, session_options=session_options
+            )
+        else:
+            model = ORTModelForSequenceClassification.from_pretrained(
+                model_id, export=True, provider=provider, session_options=session_options
+            )
+            model.save_pretrained(export_dir)
+        
+        tokenizer = AutoTokenizer.from_pretrained(model_id)
+        return pipeline("text-classification", model=model, tokenizer=tokenizer)
+    
+    def _build_label_lut(self, config):
+        """Array mapping raw label id -> canonical label id for one model"""
+        return np.array([
+            LABEL_IDS[LABEL_MAPPING.get(config.id2label[i], 'NEUTRAL')]
+            for i in range(len(config.id2label))
+        ])
+    
+    def _optimize_for_gpu(self, model_info):
+        """Cast to bfloat16 (or float16), compile, and warm up one pipeline model.
+        
+        Each step is optional: on failure the model stays usable in eager mode.
+        """
+        pipeline_obj = model_info['pipeline']
+        try:
+            dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+            pipeline_obj.model = pipeline_obj.model.to(dtype).eval()
+        except Exception as e:
+            print(f"⚠ Reduced precision failed for {model_info['name']}, keeping float32: {e}")
+            pipeline_obj.model = pipeline_obj.model.float().eval()
+        
+        if Config.NLI_TORCH_COMPILE and 'bart' not in model_info['name']:
+            model = pipeline_obj.model
+            try:
+                model.forward = torch.compile(
+                    model.forward, mode="max-autotune", dynamic=True
+                )
+                
+                # Pay the compilation cost here rather than on the first request
+                for batch in (1, 4, Config.NLI_BATCH_SIZE):
+                    self._predict_batch(
+                        model_info, ["Warmup claim."] * batch, ["Warmup evidence sentence."] * batch
+                    )
+            except Exception as e:
+                print(f"⚠ torch.compile failed for {model_info['name']}, running eager: {e}")
+                # Drop the compiled wrapper so the class's eager forward is used again
+                model.__dict__.pop('forward', None)
+    
     def classify(self, claim, evidence):
         """Classify relationship between claim and evidence using ensemble"""
+        return self.classify_batch(claim, [evidence])[0]
+    
+    def classify_batch(self, claim, evidences):
+        """Classify the claim against several evidence texts in one forward pass per model"""
+        if not evidences:
+            return []
+        
+        claims = [claim] * len(evidences)
+        if getattr(self, '_batcher', None) is not None:
+            return self._batcher.submit(claims, evidences)
+        return self._classify_pairs(claims, list(evidences))
+    
+    def _classify_pairs(self, claims, evidences):
+        """Ensemble-classify aligned lists of claims and evidence texts"""
+        neutral = {
+            'label': 'NEUTRAL',
+            'confidence': 0.5,
+            'model_votes': {}
+        }
+        
+        if not evidences:
+            return []
+        
         if not self.models:
-            return {
-                'label': 'NEUTRAL',
-                'confidence': 0.5,
-                'model_votes': {}
-            }
+            return [dict(neutral) for _ in evidences]
         
         try:
-            results = []
-            model_votes = {}
+            # Per-model predictions stacked into (K, M) arrays
+            names, weights, all_labels, all_scores = [], [], [], []
             
             for model_info in self.models:
                 try:
-                    pipeline_obj = model_info['pipeline']
-                    model_name = model_info['name']
-                    
-                    # Handle different pipeline types
-                    if 'bart' in model_name:
-                        result = pipeline_obj(
-                            evidence,
-                            candidate_labels=["entailment", "contradiction", "neutral"],
-                            hypothesis_template="This example is {}."
-                        )
-                        label = result['labels'][0]
-                        confidence = result['scores'][0]
-                    else:
-                        # Standard NLI: premise [SEP] hypothesis
-                        input_text = f"{evidence} [SEP] {claim}"
-                        result = pipeline_obj(input_text)[0]
-                        label = result['label']
-                        confidence = result['score']
-                    
-                    # Map labels
-                    label_mapping = {
-                        'ENTAILMENT': 'ENTAILMENT',
-                        'CONTRADICTION': 'CONTRADICTION',
-                        'NEUTRAL': 'NEUTRAL',
-                        'entailment': 'ENTAILMENT',
-                        'contradiction': 'CONTRADICTION',
-                        'neutral': 'NEUTRAL',
-                        'LABEL_0': 'CONTRADICTION',
-                        'LABEL_1': 'NEUTRAL',
-                        'LABEL_2': 'ENTAILMENT'
-                    }
-                    
-                    mapped_label = label_mapping.get(label, 'NEUTRAL')
-                    
-                    results.append({
-                        'label': mapped_label,
-                        'confidence': confidence,
-                        'weight': model_info['weight']
-                    })
-                    
-                    model_votes[model_name] = mapped_label
-                    
+                    label_ids, confidences = self._predict_batch(model_info, claims, evidences)
                 except Exception as e:
                     print(f"Error with model {model_info['name']}: {e}")
                     continue
+                
+                names.append(model_info['name'])
+                weights.append(model_info['weight'])
+                all_labels.append(label_ids)
+                all_scores.append(confidences)
             
-            if not results:
-                return {
-                    'label': 'NEUTRAL',
-                    'confidence': 0.5,
-                    'model_votes': {}
-                }
-            
-            # Weighted voting
-            weighted_scores = {
-                'ENTAILMENT': 0.0,
-                'CONTRADICTION': 0.0,
-                'NEUTRAL': 0.0
-            }
+            if not names:
+                return [dict(neutral) for _ in evidences]
             
-            for result in results:
-                weighted_scores[result['label']] += result['confidence'] * result['weight']
+            labels = np.stack(all_labels, axis=1)
+            final_ids, final_confidences, weighted = aggregate_votes(
+                np.stack(all_scores, axis=1), labels, np.array(weights)
+            )
             
-            # Get final label and confidence
-            final_label = max(weighted_scores, key=weighted_scores.get)
-            total_score = sum(weighted_scores.values())
-            final_confidence = weighted_scores[final_label] / total_score if total_score > 0 else 0.5
+            results = []
+            for i, final_id in enumerate(final_ids):
+                results.append({
+                    'label': LABELS[final_id],
+                    'confidence': float(final_confidences[i]),
+                    'model_votes': {name: LABELS[label_id] for name, label_id in zip(names, labels[i])},
+                    'weighted_scores': dict(zip(LABELS, weighted[i].tolist()))
+                })
             
-            return {
-                'label': final_label,
-                'confidence': final_confidence,
-                'model_votes': model_votes,
-                'weighted_scores': weighted_scores
-            }
+            return results
             
         except Exception as e:
             print(f"NLI classification error: {e}")
-            return {
-                'label': 'NEUTRAL',
-                'confidence': 0.5,
-                'model_votes': {}
-            }
+            return [dict(neutral) for _ in evidences]
+    
+    def _predict_batch(self, model_info, claims, evidences):
+        """Return (canonical label ids, confidences) arrays for each (claim, evidence) pair from one model"""
+        pipeline_obj = model_info['pipeline']
+        batch_size = Config.NLI_BATCH_SIZE
+        
+        # Handle different pipeline types
+        if 'bart' in model_info['name']:
+            outputs = pipeline_obj(
+                list(evidences),
+                candidate_labels=["entailment", "contradiction", "neutral"],
+                hypothesis_template="This example is {}.",
+                batch_size=batch_size
+            )
+            label_ids = np.array([
+                LABEL_IDS[LABEL_MAPPING.get(out['labels'][0], 'NEUTRAL')] for out in outputs
+            ])
+            return label_ids, np.array([out['scores'][0] for out in outputs])
+        
+        # Standard NLI: premise (evidence) paired with hypothesis (claim),
+        # tokenized together and run as padded batches of NLI_BATCH_SIZE
+        tokenizer = pipeline_obj.tokenizer
+        model = pipeline_obj.model
+        raw_ids = []
+        confidences = []
+        
+        for start in range(0, len(evidences), batch_size):
+            encoded = tokenizer(
+                list(evidences[start:start + batch_size]),
+                list(claims[start:start + batch_size]),
+                padding=True,
+                truncation=True,
+                return_tensors='pt'
+            ).to(model.device)
+            
+            with torch.no_grad():
+                logits = model(**encoded).logits
+            
+            probs = torch.softmax(logits.float(), dim=-1)
+            chunk_confidences, chunk_ids = probs.max(dim=-1)
+            raw_ids.append(chunk_ids.cpu().numpy())
+            confidences.append(chunk_confidences.cpu().numpy())
+        
+        # Raw model label id -> canonical label id via the precomputed LUT
+        return model_info['label_lut'][np.concatenate(raw_ids)], np.concatenate(confidences)
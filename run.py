@@ -6,6 +6,9 @@ from app import create_app
 # Create the Flask application instance
 app = create_app()
 
+# Production: gunicorn -c gunicorn.conf.py run:app (see gunicorn.conf.py).
+# The block below is the single-process development server (also works on
+# Windows, where gunicorn is unavailable).
 if __name__ == "__main__":
     print("🚀 Starting TruthCheck System...")
     print("📊 Flask Backend: http://127.0.0.1:5000") # Updated to 127.0.0.1 for local access
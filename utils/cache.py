@@ -0,0 +1,186 @@
+# utils/cache.py
+import functools
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from utils.config import Config
+from utils.similarity import encode_texts
+
+
+class SemanticClaimCache:
+    """LFU cache of verification results keyed by claim embedding"""
+
+    def __init__(self, threshold=Config.SEMANTIC_CACHE_THRESHOLD,
+                 max_entries=Config.SEMANTIC_CACHE_SIZE, ttl=Config.RESULT_CACHE_TTL):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # entry id -> [embedding, result, hit_count, expires_at]
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+        # Stacked N x D embedding matrix, rebuilt lazily after inserts/evictions
+        self._matrix = None
+        self._matrix_ids = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, embedding):
+        """Return the cached result of the most similar claim, or None"""
+        if embedding is None:
+            return None
+
+        with self._lock:
+            if not self._entries:
+                return None
+
+            if self._matrix is None:
+                self._matrix_ids = list(self._entries)
+                self._matrix = np.stack([self._entries[i][0] for i in self._matrix_ids])
+
+            # Embeddings are normalized, so one matrix-vector product gives all cosines
+            sims = self._matrix @ embedding
+            best = int(np.argmax(sims))
+            if sims[best] < self.threshold:
+                return None
+
+            entry_id = self._matrix_ids[best]
+            entry = self._entries[entry_id]
+            if entry[3] <= time.monotonic():
+                # Verdicts go stale with their evidence
+                del self._entries[entry_id]
+                self._matrix = None
+                return None
+
+            entry[2] += 1
+            return entry[1]
+
+    def put(self, embedding, result, hit_count=0, expires_at=None):
+        """Store a result under the given claim embedding"""
+        if embedding is None:
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            expired = [i for i, entry in self._entries.items() if entry[3] <= now]
+            for entry_id in expired:
+                del self._entries[entry_id]
+
+            if len(self._entries) >= self.max_entries:
+                # Evict the least frequently used entry (oldest first on ties)
+                victim = min(self._entries, key=lambda i: self._entries[i][2])
+                del self._entries[victim]
+
+            self._entries[self._next_id] = [
+                np.asarray(embedding, dtype=np.float32), result, hit_count,
+                expires_at if expires_at is not None else now + self.ttl
+            ]
+            self._next_id += 1
+            self._matrix = None
+
+
+class TwoTierCache:
+    """Exact-match LRU tier backed by a semantic LFU tier"""
+
+    def __init__(self, exact_size=Config.EXACT_CACHE_SIZE,
+                 promotion_hits=Config.CACHE_PROMOTION_HITS, ttl=Config.RESULT_CACHE_TTL):
+        self.exact_size = exact_size
+        self.promotion_hits = promotion_hits
+        self.ttl = ttl
+        self._exact = OrderedDict()  # 64-bit hash -> [text, result, hit_count, promoted, expires_at]
+        self._semantic = SemanticClaimCache(ttl=ttl)
+        self._lock = threading.Lock()
+
+    def _key(self, text):
+        # Non-cryptographic use: a 64-bit blake2b digest as an int dict key
+        return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), 'little')
+
+    def get(self, text):
+        """Return a cached result for text (exact, then semantic), or None"""
+        key = self._key(text)
+
+        with self._lock:
+            entry = self._exact.get(key)
+            if entry is not None and entry[4] <= time.monotonic():
+                del self._exact[key]
+                entry = None
+            if entry is not None:
+                self._exact.move_to_end(key)
+                entry[2] += 1
+                promote = entry[2] >= self.promotion_hits and not entry[3]
+                if promote:
+                    entry[3] = True
+
+        if entry is not None:
+            if promote:
+                self._promote(entry)
+            return entry[1]
+
+        # Nothing promoted yet: skip the SBERT encode
+        if not len(self._semantic):
+            return None
+
+        embeddings = encode_texts([text])
+        if embeddings is None:
+            return None
+        return self._semantic.get(embeddings[0])
+
+    def put(self, text, result):
+        """Store a result in the exact-match tier"""
+        key = self._key(text)
+
+        with self._lock:
+            self._exact[key] = [text, result, 0, False, time.monotonic() + self.ttl]
+            self._exact.move_to_end(key)
+
+            while len(self._exact) > self.exact_size:
+                self._exact.popitem(last=False)
+
+    def _promote(self, entry):
+        """Copy a frequently hit exact-match entry into the semantic tier"""
+        embeddings = encode_texts([entry[0]])
+        if embeddings is not None:
+            # Keep the original expiry; promotion must not extend a verdict's life
+            self._semantic.put(embeddings[0], entry[1], hit_count=entry[2], expires_at=entry[4])
+
+
+def ttl_cache(maxsize=512, ttl=900, key=None, empty_ttl=None):
+    """Thread-safe LRU memoization with per-entry expiry (seconds).
+    
+    Entries are keyed by the positional args, or by key(*args) when given.
+    Exceptions are never cached, so failed fetches are retried. Empty results
+    are kept for empty_ttl seconds (not at all when None).
+    Cached values are shared; callers must not mutate them.
+    """
+    def decorator(func):
+        entries = OrderedDict()  # cache key -> (expires_at, value)
+        lock = threading.Lock()
+        
+        @functools.wraps(func)
+        def wrapper(*args):
+            cache_key = key(*args) if key is not None else args
+            now = time.monotonic()
+            with lock:
+                hit = entries.get(cache_key)
+                if hit is not None and hit[0] > now:
+                    entries.move_to_end(cache_key)
+                    return hit[1]
+            
+            value = func(*args)
+            expiry = ttl if value else empty_ttl
+            if expiry is not None:
+                with lock:
+                    entries[cache_key] = (now + expiry, value)
+                    entries.move_to_end(cache_key)
+                    while len(entries) > maxsize:
+                        entries.popitem(last=False)
+            return value
+        
+        wrapper.cache_clear = entries.clear
+        return wrapper
+    return decorator
@@ -13,9 +13,43 @@ class Config:
     MAX_EVIDENCE_SOURCES = 10
     TOP_EVIDENCE_FOR_NLI = 4  # Use top 4 for consensus
     
+    # Cache settings
+    EXACT_CACHE_SIZE = 128
+    CACHE_PROMOTION_HITS = 2  # Exact-match hits before promotion to semantic tier
+    SEMANTIC_CACHE_THRESHOLD = 0.97  # Strict, to avoid merging distinct claims
+    SEMANTIC_CACHE_SIZE = 1000
+    RESULT_CACHE_TTL = 900  # Cached verdicts expire with the evidence behind them
+    SEARCH_CACHE_TTL = 900     # Per-source search results (news goes stale)
+    # Merged evidence per keyword set; kept below SEARCH_CACHE_TTL so the
+    # outer layer never serves results older than the per-source caches allow
+    EVIDENCE_CACHE_TTL = 300
+    EMPTY_RESULT_TTL = 120     # Sources that answered with no results
+    EMBEDDING_CACHE_SIZE = 10000  # SBERT embeddings kept per process
+    
     # Flask settings
+    # Concurrent streamed verifications per process (match the server's threads)
+    PIPELINE_WORKERS = int(os.environ.get('PIPELINE_WORKERS', 8))
     SECRET_KEY = os.environ.get('SECRET_KEY', 'truthcheck-production-key-2025')
     DEBUG = os.environ.get('DEBUG', 'False').lower() == 'true'
+    # Load model weights in create_app() but leave the warmup to each worker
+    # (set by gunicorn.conf.py when the app is preloaded and then forked)
+    PRELOAD_MODELS = os.environ.get('PRELOAD_MODELS', 'False').lower() == 'true'
+    
+    # Inference settings
+    NLI_BATCH_SIZE = 16  # (evidence, claim) pairs per NLI forward pass
+    SBERT_MAX_SEQ_LENGTH = 128  # Tokens per text for similarity encoding
+    # int8 dynamic quantization of Linear layers when running on CPU
+    QUANTIZE_CPU_MODELS = os.environ.get('QUANTIZE_CPU_MODELS', 'True').lower() == 'true'
+    # torch.compile the NLI models when running on GPU (slow first load)
+    NLI_TORCH_COMPILE = os.environ.get('NLI_TORCH_COMPILE', 'True').lower() == 'true'
+    # Merge NLI work from concurrent requests into shared forward passes
+    NLI_MICRO_BATCHING = os.environ.get('NLI_MICRO_BATCHING', 'True').lower() == 'true'
+    NLI_MAX_BATCH = 16         # Pairs per merged batch
+    NLI_BATCH_WAIT = 0.005     # Seconds to wait for more pairs before running
+    
+    # NLI inference backend: 'torch', or 'onnx' (needs optimum[onnxruntime])
+    NLI_BACKEND = os.environ.get('NLI_BACKEND', 'torch').lower()
+    ONNX_CACHE_DIR = os.environ.get('ONNX_CACHE_DIR', os.path.join('.cache', 'onnx'))
     
     # Model paths
     SPACY_MODEL = "en_core_web_sm"
@@ -1,17 +1,96 @@
 # utils/similarity.py
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 from sentence_transformers import SentenceTransformer
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
+import torch
+
+from utils.config import Config
 
 class SimilarityCalculator:
+    _instance = None
+    _initialized = False
+    
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+    
     def __init__(self): # Corrected __init__
         """Initialize sentence transformer model"""
+        if self._initialized:
+            return
+        
+        # Embeddings keyed by content hash; recurring snippets skip the encoder
+        self._emb_cache = OrderedDict()
+        self._emb_cache_lock = threading.Lock()
+        
         try:
             self.model = SentenceTransformer('all-MiniLM-L6-v2')
+            
+            # Claims and snippets are short; cap the padded sequence length
+            self.model.max_seq_length = Config.SBERT_MAX_SEQ_LENGTH
+            
+            if torch.cuda.is_available():
+                # Half precision halves activation bandwidth on GPU
+                self.model = self.model.half()
+            # Quantize Linear layers to int8 for faster CPU inference
+            elif Config.QUANTIZE_CPU_MODELS:
+                self.model = torch.quantization.quantize_dynamic(
+                    self.model, {torch.nn.Linear}, dtype=torch.qint8
+                )
+            
+            self._initialized = True
         except Exception as e:
             print(f"Error loading similarity model: {e}")
             self.model = None
     
+    def encode(self, texts):
+        """Encode texts to unit-length embeddings (None if model unavailable)"""
+        if not self.model:
+            return None
+        
+        try:
+            return self._encode_cached(texts)
+        except Exception as e:
+            print(f"Encoding error: {e}")
+            return None
+    
+    def _encode_cached(self, texts):
+        """Encode texts, reusing cached embeddings and batch-encoding only misses"""
+        keys = [hashlib.blake2b(text.encode(), digest_size=16).digest() for text in texts]
+        embeddings = [None] * len(texts)
+        misses = []
+        
+        with self._emb_cache_lock:
+            for i, key in enumerate(keys):
+                embedding = self._emb_cache.get(key)
+                if embedding is None:
+                    misses.append(i)
+                else:
+                    self._emb_cache.move_to_end(key)
+                    embeddings[i] = embedding
+        
+        if misses:
+            encoded = self.model.encode(
+                [texts[i] for i in misses],
+                batch_size=32,
+                convert_to_numpy=True,
+                normalize_embeddings=True
+            ).astype(np.float32, copy=False)  # fp16 on GPU; keep one dtype in the cache
+            
+            with self._emb_cache_lock:
+                for i, embedding in zip(misses, encoded):
+                    embeddings[i] = embedding
+                    self._emb_cache[keys[i]] = embedding
+                
+                while len(self._emb_cache) > Config.EMBEDDING_CACHE_SIZE:
+                    self._emb_cache.popitem(last=False)
+        
+        return np.stack(embeddings)
+    
     def calculate_similarity(self, text1, text2):
         """Calculate semantic similarity between two texts"""
         if not self.model:
@@ -19,25 +98,53 @@ class SimilarityCalculator:
             return 0.5  # Fallback similarity
         
         try:
-            # Encode texts to embeddings
-            embeddings = self.model.encode([text1, text2])
-            
-            # Calculate cosine similarity
-            similarity = cosine_similarity(
-                embeddings[0].reshape(1, -1),
-                embeddings[1].reshape(1, -1)
-            )[0][0]
+            # Encode texts to unit-length embeddings
+            embeddings = self._encode_cached([text1, text2])
             
-            return float(similarity)
+            # Cosine similarity of normalized vectors is their dot product
+            return float(embeddings[0] @ embeddings[1])
             
         except Exception as e:
             print(f"Similarity calculation error: {e}")
             return 0.5
+    
+    def calculate_similarity_batch(self, claim, contents):
+        """Calculate similarity of the claim to each content in one encoder call"""
+        if not self.model:
+            print("Similarity model not loaded. Returning fallback similarity.")
+            return np.full(len(contents), 0.5)
+        
+        if not contents:
+            return np.zeros(0)
+        
+        try:
+            embeddings = self._encode_cached([claim] + list(contents))
+            
+            # Normalized embeddings: cosine similarity is a single dot product
+            return embeddings[1:] @ embeddings[0]
+            
+        except Exception as e:
+            print(f"Batch similarity calculation error: {e}")
+            return np.full(len(contents), 0.5)
+
+# Global similarity calculator, loaded on first use so importing this
+# module does not block on the SBERT download
+_calculator_lock = threading.Lock()
 
-# Global similarity calculator instance
-_similarity_calculator = SimilarityCalculator()
+@lru_cache(maxsize=None)
+def get_similarity_calculator():
+    """Return the shared similarity calculator"""
+    with _calculator_lock:
+        return SimilarityCalculator()
 
 def calculate_similarity(text1, text2):
     """Global function to calculate similarity"""
-    return _similarity_calculator.calculate_similarity(text1, text2)
+    return get_similarity_calculator().calculate_similarity(text1, text2)
+
+def calculate_similarity_batch(claim, contents):
+    """Global function to calculate claim similarity against many texts"""
+    return get_similarity_calculator().calculate_similarity_batch(claim, contents)
 
+def encode_texts(texts):
+    """Global function to encode texts with the shared model"""
+    return get_similarity_calculator().encode(texts)